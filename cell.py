@@ -20,7 +20,9 @@ The draw() functions render the cells as GL rectangles.
 
 
 import math
+import time
 import itertools
+import collections
 from pyglet.gl import *
 
 
@@ -37,9 +39,13 @@ def deg_cos(angle):
 
 
 
-class Cell:
+class Config:
     """
-    The basic building block of a body.
+    The constants regulating morphogenesis.
+
+    Class attributes are the defaults, an instance overrides any of them:
+    each body develops according to its own configuration, so several
+    configurations can be used side by side.
 
     """
 
@@ -51,6 +57,58 @@ class Cell:
     gem_threshold = 7
     generation_factor = .5
 
+    # development budgets.
+    # once the body reaches cells_limit, no new cells are created.
+    # cells of generation depth_limit or higher do not gem.
+    # once work_limit genome symbols have been transcribed, no new cells
+    # are created: this bounds the cost of development deterministically.
+    # time_limit is in seconds and is only meant as a safety net, since
+    # the resulting body depends on the machine's load.
+    # None disables a budget.
+    cells_limit = 50
+    depth_limit = None
+    work_limit = None
+    time_limit = None
+
+
+
+    def __init__(self, **constants):
+        """ """
+        for k, v in constants.items():
+            if not hasattr(Config, k) or callable(getattr(Config, k)):
+                raise TypeError('unknown morphogenesis constant: ' + k)
+            setattr(self, k, v)
+
+
+
+    def replace(self, **constants):
+        """
+        Returns a copy of the configuration, with some constants changed.
+
+        """
+        d = dict(self.__dict__)
+        d.update(constants)
+        return Config(**d)
+
+
+
+    def __repr__(self):
+        """ """
+        return 'Config(%s)' % ', '.join('%s=%r' % kv for kv in sorted(self.__dict__.items()))
+
+
+
+default_config = Config()
+
+
+
+
+
+class Cell:
+    """
+    The basic building block of a body.
+
+    """
 
 
     # This defines where on a cell children can gem.
@@ -140,6 +198,7 @@ class Cell:
 
         # morphogenesis steps
         self.express_genome(target_sequence)
+        body.work += sum(self.expression.values())
         self.express_to_traits()
         self.express_to_stems()
 
@@ -186,25 +245,27 @@ class Cell:
 
         """
         ex = self.expression
+        config = self.body.config
 
         # turn
-        self.relax_angle = (ex['r'] - ex['l']) * self.turn_factor
+        self.relax_angle = (ex['r'] - ex['l']) * config.turn_factor
 
         # resize
-        self.relax_width = self.width_factor ** ex['-']
-        self.relax_height = self.height_factor ** ex['|']
+        self.relax_width = config.width_factor ** ex['-']
+        self.relax_height = config.height_factor ** ex['|']
 
 
 
     def express_to_stems(self):
         """ """
+        config = self.body.config
         for s in self.stem_symbols:
             strengths = self.stem_expression[s]
-            if sum(strengths.values()) > self.gem_threshold * 1.02**self.generation:
+            if sum(strengths.values()) > config.gem_threshold * 1.02**self.generation:
 
                 # add generation morphogen
                 # it is added only now not to interfere with the gem_threshold calculation
-                strengths[self.generation_morphogen] = self.generation * self.generation_factor
+                strengths[self.generation_morphogen] = self.generation * config.generation_factor
 
                 # find hierarchy of morphogens strengths
                 h = ''.join(sorted(strengths, key=strengths.get))
@@ -217,18 +278,16 @@ class Cell:
 
 
 
-    def gem(self):
+    def gem(self, stem):
         """
         Create a new cell at a stem point.
+        Returns the new cell, or None if the stem was not marked for spawning.
 
         """
-        cnt = 0
-        for stem in self.stem_symbols:
-            target_sequence = self.children[stem]
-            if type(target_sequence) is str:
-                self.children[stem] = Cell(self.body, target_sequence, self)
-                cnt += 1
-        return cnt
+        target_sequence = self.children[stem]
+        if type(target_sequence) is str:
+            self.children[stem] = Cell(self.body, target_sequence, self)
+            return self.children[stem]
 
 
 
@@ -236,6 +295,11 @@ class Cell:
 
     def recursive_set_coordinates(self, x=.0, y=.0, stem_angle=.0):
         """ """
+        # remember where the cell is attached, so that its subtree
+        # can be recomputed alone, and when it was last updated
+        self.attachment = x, y, stem_angle
+        self.tick = self.body.ticks
+
         # update width and height
         self.width = self.relax_width * self.stress_ratio
         self.height = self.relax_height / self.stress_ratio
@@ -268,10 +332,25 @@ class Cell:
 
 
 
+    def is_animated(self):
+        """
+        False if animate() can never change the cell's stress.
+
+        """
+        e = self.expression
+        return bool(self.parent and (e['s'] and e['n'] or e['e']))
+
+
+
     def animate(self):
-        """ """
+        """
+        Returns True if the cell's stress changed.
+
+        """
         if not self.parent:
-            return
+            return False
+
+        old_stress = self.stress_angle, self.stress_ratio
 
         # stress angle
         self.stress_angle_time = (self.stress_angle_time + 10*self.expression['s']) % 360
@@ -281,6 +360,8 @@ class Cell:
         self.stress_ratio_time = (self.stress_ratio_time + 10*self.expression['e']) % 360
         self.stress_ratio = 1.3 ** deg_sin(self.stress_ratio_time)
 
+        return (self.stress_angle, self.stress_ratio) != old_stress
+
 
 
 
@@ -325,39 +406,81 @@ class Body(list):
 
     """
 
-    # if a generation passes this limit, no new cells are created.
-    cells_limit = 50
-
-
-
-    def __init__(self, genome):
+    def __init__(self, genome, config=default_config):
         """ """
         self.genome = genome
+        self.config = config
+
+        # genome symbols transcribed during development
+        self.work = 0
 
         # start body with strongest target sequence
         best = max( (genome.count(s), s) for s in Cell.target_sequences.values() )[1]
 
         # generate body
         self.root = Cell(self, best)
-        new_cells = 1
-        last_generation = self.root.generation
-        while new_cells > 0 and len(self) < self.cells_limit:
-            new_cells = 0
-            for cell in self:
-                if cell.generation == last_generation:
-                    new_cells += cell.gem()
-            last_generation += 1
+        self.develop()
 
         # clean up
+        # a stem still marked for spawning means development was cut short
+        self.truncated = False
         for cell in self:
             for s in cell.children:
                 if not isinstance(cell.children[s], Cell):
+                    if cell.children[s] is not None:
+                        self.truncated = True
                     cell.children[s] = None
 
         # shape body
         self.scale = None
+        self.ticks = 0
         self.update_coordinates()
 
+        # Only animated cells and their subtrees can ever move.
+        # Cells are sorted breadth first, so parents come before children.
+        self.animated = [c for c in self if c.is_animated()]
+        for c in self:
+            c.mobile = c.is_animated() or bool(c.parent and c.parent.mobile)
+        self.mobile = [c for c in self if c.mobile]
+
+        # the root never moves, so there is always at least one static cell
+        static = [c for c in self if not c.mobile]
+        self.static_box = (
+            min(c.cx for c in static), min(c.cy for c in static),
+            max(c.cx for c in static), max(c.cy for c in static))
+
+
+
+    def develop(self):
+        """
+        Grows the body breadth first, one generation after the other.
+
+        Only the frontier of cells that have not gemmed yet is visited,
+        so the cost is linear in the number of cells.
+        Development stops as soon as any of the budgets is exhausted.
+
+        """
+        config = self.config
+        deadline = time.time() + config.time_limit if config.time_limit is not None else None
+
+        frontier = collections.deque([self.root])
+        while frontier and len(self) < config.cells_limit:
+            if deadline is not None and time.time() > deadline:
+                break
+
+            cell = frontier.popleft()
+            if config.depth_limit is not None and cell.generation >= config.depth_limit:
+                continue
+
+            for stem in Cell.stem_symbols:
+                if len(self) >= config.cells_limit:
+                    break
+                if config.work_limit is not None and self.work >= config.work_limit:
+                    return
+                child = cell.gem(stem)
+                if child:
+                    frontier.append(child)
+
 
 
     # recalculates cell tree geometry
@@ -374,24 +497,43 @@ class Body(list):
         """
         Executes a whole time iteration.
 
+        Only the subtrees of cells whose stress changed are recomputed.
+
         """
-        for c in self:
-            c.animate()
+        self.ticks += 1
+        changed = [c for c in self.animated if c.animate()]
 
-        self.update_coordinates()
+        # a cell already updated within an ancestor's subtree is skipped
+        for c in changed:
+            if c.tick != self.ticks:
+                c.recursive_set_coordinates(*c.attachment)
+
+
+
+    def bounding_box(self):
+        """
+        Returns min x, min y, max x, max y of all cell centers.
+
+        """
+        x0, y0, x1, y1 = self.static_box
+        for c in self.mobile:
+            if c.cx < x0: x0 = c.cx
+            elif c.cx > x1: x1 = c.cx
+            if c.cy < y0: y0 = c.cy
+            elif c.cy > y1: y1 = c.cy
+        return x0, y0, x1, y1
 
 
 
     def draw(self):
         """ """
-        x = [c.cx for c in self]
-        y = [c.cy for c in self]
-        ox = (max(x)+min(x)) /2
-        oy = (max(y)+min(y)) /2
+        x0, y0, x1, y1 = self.bounding_box()
+        ox = (x1+x0) /2
+        oy = (y1+y0) /2
 
         if not self.scale:
-            w = max(x)-min(x)
-            h = max(y)-min(y)
+            w = x1-x0
+            h = y1-y0
             self.scale = 2./max(w, h, self.root.width)
 
         glPushMatrix()
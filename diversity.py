@@ -0,0 +1,147 @@
+"""
+Compact genome sketches, to measure and preserve population diversity.
+
+A genome is summarized by the frequencies of its symbol couples, which
+for cell genomes are exactly the target sequences.
+Those profiles are centered on the profile of a uniformly random genome
+and reduced to a few random hyperplane sign bits (SimHash): the fraction
+of bits two sketches share estimates the cosine similarity of their
+profiles.
+
+Sketch size does not depend on genome length, and both the diversity
+numbers and the niche counts used for fitness sharing are computed
+without comparing every couple of genomes.
+
+"""
+
+
+
+import itertools
+import random
+
+
+
+
+
+def popcount(x):
+    """ """
+    return bin(x).count('1')
+
+
+
+def similarity(a, b, bits):
+    """
+    Estimated similarity of two sketches, 1 for identical profiles.
+
+    """
+    return 1. - popcount(a ^ b) / float(bits)
+
+
+
+
+
+class sketcher:
+    """ """
+
+    def __init__(self, code_symbols, bits=32, band_bits=8, seed=0):
+        """ """
+        self.ngrams = [''.join(p) for p in itertools.product(code_symbols, repeat=2)]
+        self.bits = bits
+        self.band_bits = band_bits
+
+        # a fixed seed keeps sketches comparable across generations and runs
+        rnd = random.Random(seed)
+        self.planes = [[rnd.gauss(0, 1) for g in self.ngrams] for b in xrange(bits)]
+
+        # projecting the center once is the same as centering every profile
+        center = 1. / len(self.ngrams)
+        self.offsets = [sum(plane)*center for plane in self.planes]
+
+
+
+    def profile(self, code):
+        """ """
+        n = float(len(code)) or 1.
+        return [code.count(g)/n for g in self.ngrams]
+
+
+
+    def sketches(self, pop):
+        """
+        Returns one integer sketch for each genome of the population.
+
+        """
+        sketches = []
+        for code in pop:
+            p = self.profile(code)
+            s = 0
+            for b, (plane, offset) in enumerate(zip(self.planes, self.offsets)):
+                if sum(w*x for w, x in zip(plane, p)) > offset:
+                    s |= 1 << b
+            sketches.append(s)
+        return sketches
+
+
+
+    def niche_counts(self, sketches):
+        """
+        For each sketch, estimates how many sketches are similar to it,
+        itself included.
+
+        Sketches are split in bands of band_bits bits: sketches sharing
+        a band fall in the same bucket, and the niche count is the
+        average bucket size over all bands.
+
+        """
+        mask = (1 << self.band_bits) - 1
+        bands = range(0, self.bits, self.band_bits)
+
+        buckets = {}
+        for s in sketches:
+            for shift in bands:
+                k = shift, (s >> shift) & mask
+                buckets[k] = buckets.get(k, 0) + 1
+
+        return [
+            sum(buckets[shift, (s >> shift) & mask] for shift in bands) / float(len(bands))
+            for s in sketches]
+
+
+
+    def diversity(self, sketches):
+        """
+        Returns a dictionary of population diversity numbers:
+        'distinct', fraction of distinct sketches
+        'mean_similarity', average similarity over all couples of sketches
+
+        """
+        n = len(sketches)
+        if n < 2:
+            return {'distinct': 1., 'mean_similarity': 1.}
+
+        # summing, bit by bit, the couples that disagree gives
+        # the total hamming distance over all couples
+        distance = 0
+        for b in xrange(self.bits):
+            ones = sum((s >> b) & 1 for s in sketches)
+            distance += ones * (n-ones)
+        couples = n*(n-1)/2
+
+        return {
+            'distinct': len(set(sketches)) / float(n),
+            'mean_similarity': 1. - distance / float(couples*self.bits),
+        }
+
+
+
+
+
+if __name__ == '__main__':
+    symbols = 'abcde'
+    pop = [''.join(random.choice(symbols) for i in xrange(1000)) for p in xrange(100)]
+    sk = sketcher(symbols)
+    print 'random population:', sk.diversity(sk.sketches(pop))
+    pop = pop[:10] * 10
+    print 'ten clones each:', sk.diversity(sk.sketches(pop))
+
+#EOF
@@ -4,7 +4,292 @@ Carries the evolution iteration of a population, according to the given
 fitness function.
 
 """
+import math
 import random
+import signal
+import itertools
+import multiprocessing
+from multiprocessing.sharedctypes import RawArray
+
+import diversity
+import novelty
+
+
+
+
+
+class population_arena:
+    """
+    A population stored in shared memory, so that worker processes
+    can read genomes and write back fitness without any pickling.
+
+    All genomes are concatenated in one contiguous buffer of symbols,
+    genome i spans symbols[offsets[i]:offsets[i+1]].
+
+    If dims is given, the arena also holds a phenotype descriptor of
+    that many values for each genome.
+
+    """
+
+    def __init__(self, pop_size, capacity, dims=0):
+        """ """
+        self.pop_size = pop_size
+        self.capacity = capacity
+        self.dims = dims
+        self.symbols = RawArray('c', capacity)
+        self.offsets = RawArray('l', pop_size+1)
+        self.fitness = RawArray('d', pop_size)
+        self.descriptors = RawArray('d', pop_size*dims) if dims else None
+
+
+
+    def store(self, pop):
+        """
+        Copies a whole population into the arena.
+        Returns False if the arena is too small to hold it.
+
+        """
+        code = ''.join(pop)
+        if len(pop) > self.pop_size or len(code) > self.capacity:
+            return False
+
+        self.symbols[:len(code)] = code
+        o = 0
+        for i, c in enumerate(pop):
+            self.offsets[i] = o
+            o += len(c)
+        self.offsets[len(pop)] = o
+        return True
+
+
+
+    def genome(self, i):
+        """ """
+        return self.symbols[self.offsets[i]:self.offsets[i+1]]
+
+
+
+    def descriptor(self, i):
+        """ """
+        return self.descriptors[i*self.dims:(i+1)*self.dims]
+
+
+
+    def set_result(self, i, result):
+        """
+        Stores what the fitness function returned for genome i.
+
+        """
+        if self.dims:
+            self.fitness[i], self.descriptors[i*self.dims:(i+1)*self.dims] = result
+        else:
+            self.fitness[i] = result
+
+
+
+    def result(self, i):
+        """ """
+        if self.dims:
+            return self.fitness[i], self.descriptor(i)
+        return self.fitness[i]
+
+
+
+
+
+# Worker processes attach to the arena only once, when the pool is created.
+# Arenas can't be pickled, they are inherited by the forked workers.
+_worker_arena = None
+_worker_fitness_function = None
+
+def _attach_worker(arena, fitness_function):
+    """ """
+    global _worker_arena, _worker_fitness_function
+
+    # ctrl-c is for the parent, which will then stop the workers
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+    _worker_arena = arena
+    _worker_fitness_function = fitness_function
+
+
+
+def _evaluate_slice(bounds):
+    """ """
+    for i in xrange(*bounds):
+        _worker_arena.set_result(i, _worker_fitness_function(_worker_arena.genome(i)))
+
+
+
+
+
+class fitness_surrogate:
+    """
+    Cheap online model predicting the fitness rank of a genome from the
+    counts of its symbols and of its symbol couples, without developing it.
+
+    If stem symbols and morphogens are given, it also uses the per-stem
+    morphogen totals: transcription goes on until the stop symbol, with
+    each stem symbol redirecting the morphogens that follow it to its
+    stem, starting from default_stem. Those totals are what decide
+    whether a cell gems at a stem.
+
+    It is a linear model on standardized features, trained with
+    normalized least mean squares on every evaluated generation.
+    Ranks are used instead of raw fitness because a few outliers
+    usually dominate the fitness range.
+
+    """
+
+    def __init__(self, code_symbols, learning_rate=.1, exploration=.2,
+                 stem_symbols=(), default_stem=None, morphogens=(), stop_symbol=None):
+        """ """
+        self.ngrams = list(code_symbols) + [''.join(p) for p in itertools.product(code_symbols, repeat=2)]
+        self.stem_symbols = sorted(stem_symbols)
+        self.default_stem = default_stem
+        self.morphogens = sorted(morphogens)
+        self.stop_symbol = stop_symbol
+        size = len(self.ngrams) + len(self.stem_symbols)*len(self.morphogens) + 1
+        self.weights = [.0] * (size + 1)
+        self.learning_rate = learning_rate
+
+        # running feature statistics, for standardization
+        self.samples = 0
+        self.means = [.0] * size
+        self.squares = [.0] * size
+
+        # fraction of screened offspring picked at random instead of
+        # by prediction, so that the model keeps seeing what it rejects
+        self.exploration = exploration
+
+        # statistics
+        self.accuracy = None
+        self.evaluations_saved = 0
+
+
+
+    def stem_totals(self, code):
+        """
+        Morphogen totals of each stem, in one pass over the genome.
+
+        """
+        if not self.stem_symbols:
+            return []
+
+        totals = dict((s, dict((m, 0) for m in self.morphogens)) for s in self.stem_symbols)
+        target_stem = self.default_stem
+        for b in code:
+            if b in totals:
+                target_stem = b
+            elif b in totals[target_stem]:
+                totals[target_stem][b] += 1
+            elif b == self.stop_symbol:
+                target_stem = self.default_stem
+        return [totals[s][m] for s in self.stem_symbols for m in self.morphogens]
+
+
+
+    def raw_features(self, code):
+        """ """
+        n = float(len(code)) or 1.
+        return ([n/1000] +
+            [code.count(g)/n for g in self.ngrams] +
+            [t/n for t in self.stem_totals(code)])
+
+
+
+    def standardize(self, raw):
+        """ """
+        f = [1.]
+        for x, m, ss in zip(raw, self.means, self.squares):
+            sd = math.sqrt(ss/self.samples) if self.samples else .0
+            f.append((x-m)/sd if sd else .0)
+        return f
+
+
+
+    def predict(self, code):
+        """ """
+        return sum(w*x for w, x in zip(self.weights, self.standardize(self.raw_features(code))))
+
+
+
+    def learn(self, pop, fitness):
+        """
+        Updates the model with an evaluated population.
+        Before updating, measures accuracy as the correlation between
+        predicted and actual fitness ranks.
+
+        """
+        raw = [self.raw_features(code) for code in pop]
+        features = [self.standardize(r) for r in raw]
+        targets = ranks(fitness)
+        predicted = [sum(w*x for w, x in zip(self.weights, f)) for f in features]
+        self.accuracy = correlation(predicted, targets)
+
+        # Welford update of the feature statistics
+        for r in raw:
+            self.samples += 1
+            for i, x in enumerate(r):
+                d = x - self.means[i]
+                self.means[i] += d / self.samples
+                self.squares[i] += d * (x - self.means[i])
+
+        for f, y in zip(features, targets):
+            p = sum(w*x for w, x in zip(self.weights, f))
+            k = self.learning_rate * (y-p) / sum(x*x for x in f)
+            self.weights = [w + k*x for w, x in zip(self.weights, f)]
+
+
+
+    def screen(self, candidates, count):
+        """
+        Returns the count most promising candidates.
+
+        """
+        if len(candidates) <= count:
+            return candidates
+
+        explore_cnt = int(count * self.exploration)
+        ranked = sorted(candidates, key=self.predict, reverse=True)
+        selected = ranked[:count-explore_cnt]
+        selected += random.sample(ranked[count-explore_cnt:], explore_cnt)
+
+        self.evaluations_saved += len(candidates) - len(selected)
+        return selected
+
+
+
+
+
+def ranks(values):
+    """
+    Ranks normalized to [0, 1], ties get their average rank.
+
+    """
+    order = sorted(range(len(values)), key=values.__getitem__)
+    r = [.0] * len(values)
+    i = 0
+    while i < len(order):
+        j = i
+        while j+1 < len(order) and values[order[j+1]] == values[order[i]]:
+            j += 1
+        for k in order[i:j+1]:
+            r[k] = (i+j) / 2. / ((len(values)-1) or 1)
+        i = j+1
+    return r
+
+
+
+def correlation(a, b):
+    """ """
+    n = float(len(a))
+    ma = sum(a)/n
+    mb = sum(b)/n
+    cov = sum((x-ma)*(y-mb) for x, y in zip(a, b))
+    va = sum((x-ma)**2 for x in a)
+    vb = sum((y-mb)**2 for y in b)
+    return cov / math.sqrt(va*vb) if va and vb else .0
 
 
 
@@ -22,8 +307,32 @@ class evolution:
 
 
 
-    def __init__(self, fitness_function, code_symbols, break_symbol, initial_pop=None):
-        """ """
+    def __init__(self, fitness_function, code_symbols, break_symbol, initial_pop=None, processes=None, surrogate_ratio=None,
+                 surrogate=None, track_diversity=False, fitness_sharing=False,
+                 novelty_search=False, novelty_weight=.5, archive_ratio=.05):
+        """
+        If processes is given, fitness is evaluated by that many worker
+        processes sharing the population through a population_arena.
+
+        If surrogate_ratio is given, each generation produces that many
+        offspring per place in the population, and a fitness_surrogate
+        selects which ones are actually evaluated; it must be at least 1.
+        A surrogate can be given, already configured, otherwise one that
+        only looks at symbol and symbol couple counts is used.
+
+        If track_diversity is set, every test_pop() stores the population
+        diversity numbers in self.diversity.
+        If fitness_sharing is set, the fitness of each genome is divided
+        by the estimated number of similar genomes in the population.
+
+        If novelty_search is set, fitness_function must return both the
+        fitness and the phenotype descriptor of a genome, so that its body
+        is developed only once: fitness is then blended, by novelty_weight,
+        with the novelty of the descriptor against a novelty.archive, and
+        the most novel archive_ratio of each generation is added to the
+        archive.
+
+        """
         self.code_symbols = code_symbols
         self.break_symbol = break_symbol
         self.fitness_function = fitness_function
@@ -31,11 +340,79 @@ class evolution:
         self.fitness = [0]*len(self.pop)
         self.generation = 0
 
+        self.processes = processes
+        self.arena = None
+        self.pool = None
+
+        if surrogate_ratio is not None and surrogate_ratio < 1:
+            raise ValueError('surrogate_ratio must be at least 1, not %r' % surrogate_ratio)
+        self.surrogate_ratio = surrogate_ratio
+        if surrogate_ratio:
+            self.surrogate = surrogate or fitness_surrogate(code_symbols)
+        else:
+            self.surrogate = None
+
+        self.fitness_sharing = fitness_sharing
+        self.sketcher = diversity.sketcher(code_symbols) if track_diversity or fitness_sharing else None
+        self.diversity = None
+
+        self.novelty_search = novelty_search
+        self.novelty_weight = novelty_weight
+        self.archive_ratio = archive_ratio
+        self.archive = novelty.archive() if novelty_search else None
+        self.novelty = None
+
+
+
+    def shared_evaluation(self):
+        """
+        Evaluates the population in the worker processes.
+        Returns what the fitness function returned for each genome.
+
+        """
+        # (re)allocate the arena only when the population outgrows it:
+        # workers need to be restarted to attach to a new one.
+        if not self.arena or not self.arena.store(self.pop):
+            self.close()
+            dims = novelty.descriptor_size if self.novelty_search else 0
+            self.arena = population_arena(len(self.pop), 2*sum(len(c) for c in self.pop), dims)
+            self.arena.store(self.pop)
+            self.pool = multiprocessing.Pool(self.processes, _attach_worker, (self.arena, self.fitness_function))
+
+        # workers only receive the bounds of the genomes they should evaluate
+        size = len(self.pop)
+        step = size / (4*self.processes) or 1
+        # waiting with a timeout lets ctrl-c through, a plain map() would hang
+        bounds = [(i, min(i+step, size)) for i in xrange(0, size, step)]
+        self.pool.map_async(_evaluate_slice, bounds).get(1<<30)
+
+        return [self.arena.result(i) for i in xrange(size)]
+
+
+
+    def close(self):
+        """
+        Stops the worker processes, if any.
+
+        """
+        if self.pool:
+            self.pool.terminate()
+            self.pool.join()
+            self.pool = None
+
 
 
     def test_pop(self):
         """ """
-        base_fit = [self.fitness_function(code) for code in self.pop]
+        if self.processes:
+            results = self.shared_evaluation()
+        else:
+            results = [self.fitness_function(code) for code in self.pop]
+
+        if self.novelty_search:
+            base_fit, descriptors = zip(*results)
+        else:
+            base_fit = results
 
         # code length does affect fitness, but it is easier
         # to factor that in here rather than within the fitness_function
@@ -51,6 +428,39 @@ class evolution:
         for i, (f, l) in enumerate(zip(base_fit, lengths)):
             self.fitness[i] = (f-Fmi) * fd * .8 ** (l*ld)
 
+        if self.surrogate:
+            self.surrogate.learn(self.pop, self.fitness)
+
+        if self.novelty_search:
+            self.test_novelty(descriptors)
+
+        if self.sketcher:
+            sketches = self.sketcher.sketches(self.pop)
+            self.diversity = self.sketcher.diversity(sketches)
+            if self.fitness_sharing:
+                niches = self.sketcher.niche_counts(sketches)
+                for i, n in enumerate(niches):
+                    self.fitness[i] /= n
+
+
+
+    def test_novelty(self, descriptors):
+        """
+        Blends fitness with the novelty of each genome's phenotype.
+
+        """
+        self.novelty = [self.archive.novelty(d) for d in descriptors]
+
+        nd = 1./max(self.novelty) if max(self.novelty) else 1.
+        w = self.novelty_weight
+        for i, n in enumerate(self.novelty):
+            self.fitness[i] = (1-w) * self.fitness[i] + w * n * nd
+
+        # archive the most novel
+        best = sorted(range(len(self.pop)), key=self.novelty.__getitem__, reverse=True)
+        for i in best[:int(len(self.pop) * self.archive_ratio) or 1]:
+            self.archive.add(descriptors[i])
+
 
 
     def pick_fit_parent(self):
@@ -116,7 +526,12 @@ class evolution:
         #elders = zip(*best)[1]
 
         # produce youths
-        youths = [ self.add_random_errors(self.recombine_from_parents()) for i in xrange(youths_cnt)]
+        if self.surrogate:
+            candidates_cnt = int(youths_cnt * self.surrogate_ratio)
+            candidates = [ self.add_random_errors(self.recombine_from_parents()) for i in xrange(candidates_cnt)]
+            youths = self.surrogate.screen(candidates, youths_cnt)
+        else:
+            youths = [ self.add_random_errors(self.recombine_from_parents()) for i in xrange(youths_cnt)]
 
         # done
         self.generation += 1
@@ -2,6 +2,9 @@
 """
 Loads and display populations through their whole evolutionary history.
 
+With --live, follows instead the best individuals of a running
+main_evolve.py --publish.
+
 """
 from pyglet.gl import *
 import pyglet.window.key as key
@@ -9,6 +12,7 @@ import random
 import sys
 
 import cell
+import monitor
 
 
 
@@ -16,11 +20,15 @@ import cell
 
 class Gui:
 
-    def __init__(self, pops):
+    def __init__(self, pops, subscriber=None):
 
         # list of populations
         self.pops = pops
 
+        # live mode: each received champion is added as a new generation
+        self.subscriber = subscriber
+        self.live = None
+
         # selected generation
         self.sgen = 0
 
@@ -36,6 +44,7 @@ class Gui:
         self.window.push_handlers(self.keys)
         self.window.on_draw = self.draw
         def update(latency):
+            if self.subscriber: self.receive()
             self.keyboard_input()
             self.dbody.update()
         pyglet.clock.schedule_interval(update, 0.1)
@@ -54,6 +63,28 @@ class Gui:
 
 
 
+    def receive(self):
+        messages = self.subscriber.receive()
+        if not messages:
+            return
+
+        # the first champion replaces the placeholder population
+        if not self.live:
+            self.pops = []
+
+        # keep following the run, unless browsing older champions
+        follow = not self.live or self.sgen == len(self.pops)-1
+
+        self.pops += [[str(m['best'])] for m in messages]
+        self.live = messages[-1]
+
+        if follow:
+            self.sgen = len(self.pops)-1
+            self.sind = 0
+            self.reset_body()
+
+
+
     def reset_body(self):
         self.dbody = cell.Body(self.pops[self.sgen][self.sind])
 
@@ -98,6 +129,8 @@ class Gui:
             self.sgen, len(self.pops),
             len(self.dbody)
         )
+        if self.live:
+            text += ", live gen %d" % self.live['generation']
         glPushMatrix()
         pyglet.text.Label(text,
             font_name='Times New Roman', font_size=20,
@@ -163,7 +196,9 @@ def get_random_code():
 
 def main():
 
-    if len(sys.argv) > 1:
+    if '--live' in sys.argv:
+        gui = Gui([[get_random_code()]], monitor.subscriber())
+    elif len(sys.argv) > 1:
         gui = Gui([gen.split('\n')[1:] for gen in open(sys.argv[1]).read().split('###')[1:]])
     else:
         gui = Gui([[get_random_code() for i in xrange(50)]])
@@ -3,12 +3,27 @@
 Creates a random population.
 Evolves the population, selecting according to aestetics.
 Saves the entire population at each generation.
+
+With --publish, the best genome of each generation is also streamed
+to live viewers, see main_display.py --live.
+
+With --surrogate, offspring are pre-screened by a fitness surrogate
+before being developed.
+
+With --diversity, population diversity is reported at each generation,
+and with --sharing fitness is also shared among similar genomes.
+
+With --novelty, fitness is blended with the novelty of each body.
+
+With --processes N, fitness is evaluated by N worker processes.
 """
 import sys
 import datetime
 
 import cell
 import evolve
+import monitor
+import novelty
 
 
 
@@ -17,10 +32,24 @@ import evolve
 #
 # This is the most important piece
 #
-def fit_surface(code):
+def fit_surface(code, config=cell.default_config):
 
     # create the body to be evaluated
-    body = cell.Body(code)
+    return fit_body(cell.Body(code, config))
+
+
+
+def fit_and_describe(code, config=cell.default_config):
+
+    # fitness and novelty descriptor from a single development
+    body = cell.Body(code, config)
+    return fit_body(body), novelty.descriptor(body)
+
+
+
+def fit_body(body):
+
+    code = body.genome
 
     # estimate body extension
     # --> select for spread bodies
@@ -61,27 +90,68 @@ def fit_surface(code):
 #
 def main():
 
+    argv = sys.argv[1:]
+
+    # the only option with a value
+    processes = None
+    if '--processes' in argv:
+        i = argv.index('--processes')
+        processes = int(argv[i+1])
+        del argv[i:i+2]
+
+    options = [a for a in argv if a.startswith('--')]
+    args = [a for a in argv if not a.startswith('--')]
+
     # evolution
-    ev = evolve.evolution(fit_surface, cell.Cell.code_symbols, ' ')
+    novelty_search = '--novelty' in options
+    ev = evolve.evolution(fit_and_describe if novelty_search else fit_surface, cell.Cell.code_symbols, ' ',
+        processes=processes,
+        novelty_search=novelty_search,
+        surrogate_ratio=3 if '--surrogate' in options else None,
+        surrogate=evolve.fitness_surrogate(cell.Cell.code_symbols,
+            stem_symbols=cell.Cell.stem_symbols, default_stem='^',
+            morphogens=cell.Cell.code_morphogens, stop_symbol=' '),
+        track_diversity='--diversity' in options,
+        fitness_sharing='--sharing' in options)
 
     # output file
     fn = 'genesis'+datetime.datetime.now().strftime('%y%m%d_%H%M%S')
-    if len(sys.argv) > 1: fn = sys.argv[1]
+    if args: fn = args[0]
     out = open(fn, 'wt')
 
+    # live viewers
+    publisher = monitor.publisher() if '--publish' in options else None
+
     # evolve
-    while ev.generation < 2000:
-        fitness, best_code = ev.iterate()
-
-        # output
-        body = cell.Body(best_code)
-        print 'generation:%3d  genome length:%d  cells:%d' % (ev.generation, len(best_code), len(body))
-
-        # save and flush
-        out.write('#####        generation %d\n' % ev.generation)
-        out.write('\n'.join(ev.pop))
-        out.write('\n')
-        out.flush()
+    try:
+        while ev.generation < 2000:
+            fitness, best_code = ev.iterate()
+
+            # output
+            body = cell.Body(best_code)
+            line = 'generation:%3d  genome length:%d  cells:%d' % (ev.generation, len(best_code), len(body))
+            if ev.surrogate:
+                line += '  surrogate accuracy:%.2f saved:%d' % (ev.surrogate.accuracy, ev.surrogate.evaluations_saved)
+            if ev.diversity:
+                line += '  distinct:%.2f similarity:%.3f' % (ev.diversity['distinct'], ev.diversity['mean_similarity'])
+            print line
+
+            if publisher:
+                publisher.publish({
+                    'generation': ev.generation,
+                    'fitness': fitness,
+                    'length': len(best_code),
+                    'cells': len(body),
+                    'best': best_code,
+                })
+
+            # save and flush
+            out.write('#####        generation %d\n' % ev.generation)
+            out.write('\n'.join(ev.pop))
+            out.write('\n')
+            out.flush()
+    finally:
+        ev.close()
 
 
 
@@ -0,0 +1,154 @@
+#!/usr/bin/python -B
+"""
+Sweeps morphogenesis configurations over corpora of genomes.
+Every configuration develops every genome of every corpus, in parallel,
+and fitness and cell count statistics are reported per configuration.
+
+Each argument is a corpus file: either a saved evolution history or
+just one genome per line.
+"""
+import sys
+import random
+import itertools
+import multiprocessing
+
+import cell
+import main_evolve
+
+
+
+# =============================================================================
+# SWEEP
+#
+def configurations(**values):
+    """
+    Returns a Config for each combination of the given values, ie:
+        configurations(gem_threshold=[6, 7, 8], cells_limit=[50, 200])
+
+    """
+    names = sorted(values)
+    return [
+        cell.Config(**dict(zip(names, combination)))
+        for combination in itertools.product(*[values[n] for n in names])]
+
+
+
+# Corpora are inherited by the forked workers, tasks only carry indexes.
+_worker_configs = None
+_worker_corpora = None
+
+def _attach_worker(configs, corpora):
+    """ """
+    global _worker_configs, _worker_corpora
+    _worker_configs = configs
+    _worker_corpora = corpora
+
+
+
+def _evaluate(task):
+    """ """
+    config_index, corpus_name = task
+    config = _worker_configs[config_index]
+
+    fitness = []
+    cells = []
+    truncated = 0
+    for code in _worker_corpora[corpus_name]:
+        body = cell.Body(code, config)
+        fitness.append(main_evolve.fit_body(body))
+        cells.append(len(body))
+        truncated += body.truncated
+
+    return config_index, corpus_name, fitness, cells, truncated
+
+
+
+def run(configs, corpora, processes=None):
+    """
+    Evaluates every configuration on every corpus, corpora being a
+    dictionary of lists of genomes.
+
+    Returns the list of (config index, corpus name, fitness list,
+    cell count list, truncated bodies count).
+
+    """
+    tasks = [(i, name) for i in xrange(len(configs)) for name in sorted(corpora)]
+    pool = multiprocessing.Pool(processes, _attach_worker, (configs, corpora))
+    try:
+        return pool.map(_evaluate, tasks, 1)
+    finally:
+        pool.terminate()
+        pool.join()
+
+
+
+def report(configs, results):
+    """
+    One line for every configuration and corpus, plus one line for every
+    configuration over all its corpora.
+
+    """
+    def stats(label, fitness, cells, truncated):
+        n = float(len(fitness))
+        return '    %-20s %6d %10.4g %10.4g %10.4g %8.1f %6d %6.1f%%' % (
+            label, len(fitness),
+            sum(fitness)/n, min(fitness), max(fitness),
+            sum(cells)/n, max(cells), 100*truncated/n)
+
+    lines = []
+    for i, config in enumerate(configs):
+        lines.append(repr(config))
+        lines.append('    %-20s %6s %10s %10s %10s %8s %6s %7s' % (
+            'corpus', 'bodies', 'fit mean', 'fit min', 'fit max', 'cells', 'max', 'trunc'))
+
+        fitness, cells, truncated = [], [], 0
+        for config_index, corpus_name, f, c, t in results:
+            if config_index == i and f:
+                lines.append(stats(corpus_name, f, c, t))
+                fitness += f
+                cells += c
+                truncated += t
+        if fitness:
+            lines.append(stats('all', fitness, cells, truncated))
+        lines.append('')
+
+    return '\n'.join(lines)
+
+
+
+
+
+# =============================================================================
+# MAIN
+#
+def load_corpus(filename):
+    """ """
+    # history files mark generations with '#' lines
+    return [l for l in open(filename).read().split('\n') if l and not l.startswith('#')]
+
+
+
+def main():
+
+    if len(sys.argv) > 1:
+        corpora = dict((fn, load_corpus(fn)) for fn in sys.argv[1:])
+    else:
+        corpora = {'random': [
+            ''.join(random.choice(cell.Cell.code_symbols) for i in xrange(1000))
+            for p in xrange(100)]}
+
+    configs = configurations(
+        gem_threshold=[5, 7, 9],
+        generation_factor=[.25, .5, 1.],
+    )
+
+    print report(configs, run(configs, corpora))
+
+
+
+if __name__ == '__main__':
+    main()
+
+
+
+#EOF ==========================================================================
@@ -0,0 +1,181 @@
+"""
+Streams the progress of a running evolution to live viewers.
+
+The publisher sits in the evolution loop and the subscriber in the
+display loop: both use only non-blocking sockets, so neither loop ever
+waits for the other.
+
+Messages are dictionaries, sent as one line of JSON each.
+
+"""
+
+
+
+import json
+import errno
+import socket
+
+
+
+default_address = ('127.0.0.1', 7342)
+
+# socket errors that only mean "try again later"
+would_block = (errno.EAGAIN, errno.EWOULDBLOCK, errno.EINPROGRESS)
+
+
+
+
+
+class publisher:
+    """
+    Sends every published message to all connected subscribers.
+
+    Subscribers are accepted at each publish(), and first receive the
+    previous message so they can show something at once, while subscribers
+    that fall more than pending_limit bytes behind are disconnected,
+    and are free to connect again.
+
+    """
+
+    def __init__(self, address=default_address, pending_limit=1<<22):
+        """ """
+        self.server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.server.bind(address)
+        self.server.listen(5)
+        self.server.setblocking(0)
+
+        self.pending_limit = pending_limit
+        self.clients = {}   # socket -> data not sent yet
+        self.last = ''
+
+
+
+    def accept(self):
+        """ """
+        while True:
+            try:
+                s, address = self.server.accept()
+            except socket.error as e:
+                if e.errno in would_block: return
+                raise
+            s.setblocking(0)
+            self.clients[s] = self.last
+
+
+
+    def flush(self, s):
+        """
+        Sends as much pending data as the socket takes without blocking.
+
+        """
+        try:
+            sent = s.send(self.clients[s])
+        except socket.error as e:
+            if e.errno in would_block: return
+            self.drop(s)
+            return
+        self.clients[s] = self.clients[s][sent:]
+
+
+
+    def drop(self, s):
+        """ """
+        del self.clients[s]
+        s.close()
+
+
+
+    def publish(self, message):
+        """ """
+        # subscribers connected in the meantime start from the previous message
+        self.accept()
+        self.last = json.dumps(message) + '\n'
+
+        for s in self.clients.keys():
+            if len(self.clients[s]) > self.pending_limit:
+                self.drop(s)
+            else:
+                self.clients[s] += self.last
+                self.flush(s)
+
+
+
+    def close(self):
+        """ """
+        for s in self.clients.keys():
+            self.drop(s)
+        self.server.close()
+
+
+
+
+
+class subscriber:
+    """
+    Receives messages from a publisher, (re)connecting when needed.
+
+    """
+
+    def __init__(self, address=default_address):
+        """ """
+        self.address = address
+        self.socket = None
+        self.buffer = ''
+
+
+
+    def connect(self):
+        """ """
+        s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        s.setblocking(0)
+        if s.connect_ex(self.address) in (0,) + would_block:
+            self.socket = s
+        else:
+            s.close()
+
+
+
+    def disconnect(self):
+        """ """
+        self.socket.close()
+        self.socket = None
+
+
+
+    def receive(self):
+        """
+        Returns the list of the messages arrived since the last call.
+
+        """
+        if not self.socket:
+            self.connect()
+            if not self.socket:
+                return []
+
+        while True:
+            try:
+                data = self.socket.recv(1<<16)
+            except socket.error as e:
+                if e.errno not in would_block:
+                    self.disconnect()
+                break
+
+            # publisher is gone
+            if not data:
+                self.disconnect()
+                break
+            self.buffer += data
+
+        lines = self.buffer.split('\n')
+        self.buffer = lines.pop()
+
+        # a message cut by a disconnection is lost
+        if not self.socket:
+            self.buffer = ''
+
+        return [json.loads(l) for l in lines if l]
+
+
+
+#EOF
@@ -0,0 +1,237 @@
+"""
+Spatial index over the cells of a developed body.
+
+Cells are oriented rectangles: each one is stored in all the buckets of
+a uniform grid that its axis aligned bounding box touches, so that
+overlap and point queries only test cells that are actually nearby
+instead of every pair of cells.
+
+The index keeps the bucket range of every cell, and update() moves
+only the cells whose bounding box left their buckets, so it can follow
+a body as Body.update() animates it, looking only at its mobile cells.
+
+"""
+
+
+
+import itertools
+
+import cell
+
+
+
+
+
+def cell_corners(c):
+    """
+    Corners of a cell's rectangle, counterclockwise.
+
+    """
+    # same axes used by Cell.recursive_set_coordinates and Cell.draw
+    ux, uy = cell.deg_sin(c.angle), cell.deg_cos(c.angle)
+    rx, ry = uy, -ux
+    w, h = c.width/2, c.height/2
+    return [
+        (c.cx + sw*w*rx + sh*h*ux, c.cy + sw*w*ry + sh*h*uy)
+        for sw, sh in ((-1, -1), (+1, -1), (+1, +1), (-1, +1))]
+
+
+
+def corners_overlap(a, b):
+    """
+    Separating axis test between two convex quads.
+    Quads that merely touch along an edge do not overlap.
+
+    """
+    for quad in (a, b):
+        for (x0, y0), (x1, y1) in zip(quad, quad[1:] + quad[:1]):
+            # axis normal to the edge
+            nx, ny = y0-y1, x1-x0
+            pa = [nx*x + ny*y for x, y in a]
+            pb = [nx*x + ny*y for x, y in b]
+            if max(pa) <= min(pb) + 1e-9 or max(pb) <= min(pa) + 1e-9:
+                return False
+    return True
+
+
+
+def corners_contain(quad, x, y):
+    """ """
+    # the point must be on the inner side of every edge
+    for (x0, y0), (x1, y1) in zip(quad, quad[1:] + quad[:1]):
+        if (x1-x0)*(y-y0) - (y1-y0)*(x-x0) < 0:
+            return False
+    return True
+
+
+
+
+
+class Grid:
+    """
+    Uniform grid of buckets, each holding the indexes of the cells
+    whose bounding box touches it.
+
+    """
+
+    def __init__(self, body, bucket_size=None):
+        """ """
+        self.body = body
+
+        # by default, a bucket is about as large as an average cell
+        if not bucket_size:
+            bucket_size = sum(max(c.width, c.height) for c in body) / len(body)
+        self.bucket_size = float(bucket_size) or 1.
+
+        self.buckets = {}
+        self.corners = [None] * len(body)
+        self.boxes = [None] * len(body)
+        self.ranges = [None] * len(body)
+        for i in xrange(len(body)):
+            self.insert(i)
+
+        # only these can move when the body animates
+        self.mobile = [i for i, c in enumerate(body) if c.mobile]
+
+
+
+    def bucket_range(self, box):
+        """ """
+        s = self.bucket_size
+        x0, y0, x1, y1 = box
+        return int(x0//s), int(y0//s), int(x1//s), int(y1//s)
+
+
+
+    def range_buckets(self, r):
+        """ """
+        i0, j0, i1, j1 = r
+        return itertools.product(xrange(i0, i1+1), xrange(j0, j1+1))
+
+
+
+    def insert(self, i):
+        """ """
+        q = self.corners[i] = cell_corners(self.body[i])
+        x = [p[0] for p in q]
+        y = [p[1] for p in q]
+        box = self.boxes[i] = min(x), min(y), max(x), max(y)
+        r = self.ranges[i] = self.bucket_range(box)
+        for k in self.range_buckets(r):
+            self.buckets.setdefault(k, set()).add(i)
+
+
+
+    def remove(self, i):
+        """ """
+        for k in self.range_buckets(self.ranges[i]):
+            b = self.buckets[k]
+            b.discard(i)
+            if not b:
+                del self.buckets[k]
+
+
+
+    def update(self):
+        """
+        Follows the cells after they moved.
+        Only mobile cells are checked, and only those whose bucket range
+        changed are moved between buckets.
+
+        Returns the number of cells that changed buckets.
+
+        """
+        moved = 0
+        for i in self.mobile:
+            c = self.body[i]
+            old_range = self.ranges[i]
+            q = self.corners[i] = cell_corners(c)
+            x = [p[0] for p in q]
+            y = [p[1] for p in q]
+            box = self.boxes[i] = min(x), min(y), max(x), max(y)
+            if self.bucket_range(box) != old_range:
+                self.remove(i)
+                self.insert(i)
+                moved += 1
+        return moved
+
+
+
+    def overlapping_pairs(self, skip_attached=True):
+        """
+        Returns the sorted list of (i, j) index couples, i < j,
+        of cells that overlap each other.
+
+        Parent and child always share an edge, so by default their
+        overlap is not reported.
+
+        """
+        candidates = set()
+        for b in self.buckets.itervalues():
+            if len(b) > 1:
+                candidates.update(itertools.combinations(sorted(b), 2))
+
+        pairs = []
+        for i, j in candidates:
+            a, b = self.boxes[i], self.boxes[j]
+            # cheap bounding box rejection first
+            if a[0] > b[2] or b[0] > a[2] or a[1] > b[3] or b[1] > a[3]:
+                continue
+            if skip_attached:
+                ci, cj = self.body[i], self.body[j]
+                if ci.parent is cj or cj.parent is ci:
+                    continue
+            if corners_overlap(self.corners[i], self.corners[j]):
+                pairs.append((i, j))
+
+        return sorted(pairs)
+
+
+
+    def cells_at(self, x, y):
+        """
+        Returns the sorted indexes of all the cells covering a point.
+
+        """
+        s = self.bucket_size
+        b = self.buckets.get((int(x//s), int(y//s)), ())
+        return sorted(i for i in b if corners_contain(self.corners[i], x, y))
+
+
+
+    def union_area(self, resolution=64):
+        """
+        Estimates the area covered by at least one cell, sampling a
+        resolution x resolution lattice over the body bounding box.
+
+        """
+        x0 = min(b[0] for b in self.boxes)
+        y0 = min(b[1] for b in self.boxes)
+        x1 = max(b[2] for b in self.boxes)
+        y1 = max(b[3] for b in self.boxes)
+        dx = (x1-x0) / resolution
+        dy = (y1-y0) / resolution
+
+        covered = 0
+        for i in xrange(resolution):
+            for j in xrange(resolution):
+                if self.cells_at(x0 + (i+.5)*dx, y0 + (j+.5)*dy):
+                    covered += 1
+
+        return covered * dx * dy
+
+
+
+
+
+if __name__ == '__main__':
+    import random
+    code = ''.join(random.choice(cell.Cell.code_symbols) for i in xrange(1000))
+    body = cell.Body(code)
+    grid = Grid(body)
+    print 'cells:', len(body)
+    print 'overlapping pairs:', len(grid.overlapping_pairs())
+    print 'cells area:', sum(c.width*c.height for c in body)
+    print 'union area:', grid.union_area()
+
+#EOF